@@ -1,21 +1,75 @@
 import os
+import asyncio
+import pathlib
+from contextlib import asynccontextmanager
+import httpx
 from dotenv import load_dotenv
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from openai import OpenAI, AsyncOpenAI # Use Async client for FastAPI
+from typing import Optional
+from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Query, Request, Response
+from fastapi.responses import JSONResponse
+from openai import OpenAI, AsyncOpenAI, DefaultAsyncHttpxClient # Use Async client for FastAPI
 
 # Assuming schemas and services are structured as planned
-from schemas.analysis import AnalysisResponse
+from schemas.analysis import AnalysisResponse, AnalysisWithChartsResponse, AnyChart
 from app.services.assistant_service import FinancialAssistantService
+from app.services.thread_pool import ThreadPool
+from app.services.config_registry import fingerprint_from_assistant, stamped_fingerprint, local_fingerprint
+from app.services.admission_control import AdmissionController, AdmissionRejected
+from app.services.chart_service import ChartRenderService, CHART_MEDIA_TYPES
+from app.services.result_store import ResultStore, MIN_COMPRESS_BYTES, negotiate_encoding, etag_matches
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Project root, used to anchor relative paths independently of the working directory
+ROOT_DIR = pathlib.Path(__file__).parent.parent
+
 # --- API Configuration ---
 API_TITLE = "Financial Analysis Service"
 API_VERSION = "0.1.0"
 API_DESCRIPTION = "Receives a municipal budget CSV and returns a structured financial analysis using OpenAI Assistants."
 # -------------------------
 
+# --- Admission Control Configuration ---
+MAX_INFLIGHT_UPLOAD_BYTES = int(os.getenv("MAX_INFLIGHT_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+MAX_ACTIVE_RUNS = int(os.getenv("MAX_ACTIVE_RUNS", "8"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "16"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "10"))
+# ---------------------------------------
+
+# --- Chart Rendering Configuration ---
+CHART_RENDER_WORKERS = int(os.getenv("CHART_RENDER_WORKERS", "2"))
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", "256"))
+# Shared directory for chart payloads, so every worker can serve any chart URL.
+# Relative paths are resolved against the project root; empty keeps them in memory only.
+CHART_STORE_DIR = os.getenv("CHART_STORE_DIR", "data/charts")
+CHART_STORE_MAX_FILES = int(os.getenv("CHART_STORE_MAX_FILES", "50000"))
+CHART_STORE_MAX_AGE_DAYS = float(os.getenv("CHART_STORE_MAX_AGE_DAYS", "30"))
+# Chart images are addressed by content hash, so they never change and can be cached "forever"
+CHART_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# -------------------------------------
+
+# --- Result Store Configuration ---
+RESULT_STORE_SIZE = int(os.getenv("RESULT_STORE_SIZE", "512"))
+# Shared directory for stored results; point every worker/replica at the same path.
+# Relative paths are resolved against the project root. Set to an empty value to keep
+# results in memory only (single worker, lost on restart).
+RESULT_STORE_DIR = os.getenv("RESULT_STORE_DIR", "data/results")
+# Disk bound per config fingerprint: max result files, and max age (also for stale fingerprints)
+RESULT_STORE_MAX_FILES = int(os.getenv("RESULT_STORE_MAX_FILES", "10000"))
+RESULT_STORE_MAX_AGE_DAYS = float(os.getenv("RESULT_STORE_MAX_AGE_DAYS", "30"))
+# Results are immutable per id, but clients should revalidate (cheap 304s) before reuse
+RESULT_CACHE_CONTROL = "no-cache"
+# ----------------------------------
+
+# --- Warmup Configuration ---
+THREAD_POOL_SIZE = int(os.getenv("THREAD_POOL_SIZE", str(MAX_ACTIVE_RUNS)))
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "120"))
+KEEP_WARM_INTERVAL = float(os.getenv("KEEP_WARM_INTERVAL", "60"))
+# ----------------------------
+
 # --- Initialize OpenAI Client and Service ---
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 ASSISTANT_ID = os.getenv("ASSISTANT_ID")
@@ -27,27 +81,164 @@ if not ASSISTANT_ID:
     raise ValueError("ASSISTANT_ID environment variable not set. Run scripts/create_assistant.py first.")
 
 # Use AsyncOpenAI for compatibility with FastAPI async endpoints
-client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+# A longer keep-alive than httpx's default (5s) lets warmed connections survive between requests
+http_client = DefaultAsyncHttpxClient(
+    limits=httpx.Limits(
+        max_connections=max(MAX_ACTIVE_RUNS * 2, WARMUP_CONNECTIONS),
+        max_keepalive_connections=max(MAX_ACTIVE_RUNS, WARMUP_CONNECTIONS),
+        keepalive_expiry=HTTP_KEEPALIVE_SECONDS,
+    ),
+)
+client = AsyncOpenAI(api_key=OPENAI_API_KEY, http_client=http_client)
+
+# Pre-created empty threads, checked out by each analysis
+thread_pool = ThreadPool(client=client, size=THREAD_POOL_SIZE)
 
 # Instantiate the service
-assistant_service = FinancialAssistantService(client=client, assistant_id=ASSISTANT_ID)
+assistant_service = FinancialAssistantService(client=client, assistant_id=ASSISTANT_ID, thread_pool=thread_pool)
+
+# Bounds concurrent uploads/runs so overload is shed instead of slowing every request
+admission_controller = AdmissionController(
+    max_inflight_bytes=MAX_INFLIGHT_UPLOAD_BYTES,
+    max_active_runs=MAX_ACTIVE_RUNS,
+    max_queue_size=ADMISSION_QUEUE_SIZE,
+    max_queue_wait=ADMISSION_QUEUE_TIMEOUT,
+    retry_after=ADMISSION_RETRY_AFTER,
+)
+
+chart_service = ChartRenderService(
+    max_workers=CHART_RENDER_WORKERS,
+    cache_size=CHART_CACHE_SIZE,
+    directory=ROOT_DIR / CHART_STORE_DIR if CHART_STORE_DIR else None,
+    max_files=CHART_STORE_MAX_FILES,
+    max_age=CHART_STORE_MAX_AGE_DAYS * 24 * 3600,
+)
+
+result_store = ResultStore(
+    max_entries=RESULT_STORE_SIZE,
+    directory=ROOT_DIR / RESULT_STORE_DIR if RESULT_STORE_DIR else None,
+    max_files=RESULT_STORE_MAX_FILES,
+    max_age=RESULT_STORE_MAX_AGE_DAYS * 24 * 3600,
+)
 # ------------------------------------------
 
+warmup_status = {"warmed_up": False, "assistant_name": None, "assistant_model": None}
+
+# --- Assistant Config Tracking ---
+config_status = {"assistant_id": ASSISTANT_ID, "fingerprint": None, "stamped_fingerprint": None, "local_fingerprint": None, "in_sync": None}
+
+def apply_assistant_config(assistant):
+    """Records the running assistant's config fingerprint and invalidates results from other configs.
+
+    The fingerprint is computed from the assistant's actual instructions, function schema and
+    model, so in-place edits change it. The metadata stamp and the local files are cross-checks.
+    """
+    fingerprint = fingerprint_from_assistant(assistant)
+    stamped = stamped_fingerprint(assistant)
+    local = local_fingerprint(assistant.model)
+    references = [f for f in (stamped, local) if f]
+    in_sync = all(f == fingerprint for f in references) if fingerprint and references else None
+    if fingerprint != config_status["fingerprint"]:
+        print(f"Active assistant config fingerprint: {fingerprint}")
+    # Only warn when the state changes, not on every keep-warm ping
+    if in_sync is False and config_status["in_sync"] is not False:
+        if stamped and stamped != fingerprint:
+            print("Warning: Assistant was edited in place since scripts/create_assistant.py created it.")
+        if local and local != fingerprint:
+            print("Warning: Assistant config differs from assistant_config/. Run scripts/create_assistant.py.")
+    config_status.update(fingerprint=fingerprint, stamped_fingerprint=stamped, local_fingerprint=local, in_sync=in_sync)
+    invalidated = result_store.set_fingerprint(fingerprint)
+    if invalidated:
+        print(f"Invalidated {invalidated} stored results from a previous assistant config.")
+# ---------------------------------
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warms up the service before it accepts traffic and releases resources on shutdown."""
+    # Created here rather than at import, so a read-only filesystem cannot break importing the app
+    result_store.open()
+    chart_service.start()
+    # Fails startup if the assistant cannot be verified, so broken deploys never go live
+    assistant = await assistant_service.warmup(connections=WARMUP_CONNECTIONS)
+    await thread_pool.start()
+    apply_assistant_config(assistant)
+    warmup_status.update(warmed_up=True, assistant_name=assistant.name, assistant_model=assistant.model)
+    # Keep-warm pings also re-check the assistant, so in-place config changes are picked up
+    keep_warm_task = asyncio.create_task(assistant_service.keep_warm(KEEP_WARM_INTERVAL, connections=WARMUP_CONNECTIONS, on_assistant=apply_assistant_config))
+    print("Warmup complete.")
+    try:
+        yield
+    finally:
+        keep_warm_task.cancel()
+        try:
+            await keep_warm_task
+        except asyncio.CancelledError:
+            pass
+        await thread_pool.close()
+        chart_service.shutdown()
+        await client.close()
+
 # --- FastAPI Application ---
 app = FastAPI(
     title=API_TITLE,
     version=API_VERSION,
-    description=API_DESCRIPTION
+    description=API_DESCRIPTION,
+    lifespan=lifespan
 )
 
+# Requests that go through admission control (method, path)
+ADMITTED_ROUTES = {("POST", "/analyze")}
+
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Admits analysis requests by their declared Content-Length before the upload body is read.
+
+    Over-budget requests are rejected with 429/503 and Retry-After without
+    receiving or parsing the multipart body, and the reserved bytes stay
+    held until the analysis response is ready.
+    """
+    if (request.method, request.url.path) not in ADMITTED_ROUTES:
+        return await call_next(request)
+    content_length = request.headers.get("content-length")
+    if content_length is None or not content_length.isdigit():
+        return JSONResponse(status_code=411, content={"detail": "A Content-Length header is required for uploads."})
+    try:
+        async with admission_controller.admit(int(content_length)):
+            return await call_next(request)
+    except AdmissionRejected as exc:
+        return JSONResponse(
+            status_code=exc.status_code,
+            content={"detail": str(exc)},
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
+def _chart_url(chart_id: str, image_format: str) -> str:
+    return f"/charts/{chart_id}.{image_format}"
+
+def _chart_response(chart_id: str, image: bytes, image_format: str) -> Response:
+    """Builds an image response with long-lived cache headers."""
+    return Response(
+        content=image,
+        media_type=CHART_MEDIA_TYPES[image_format],
+        headers={
+            "Cache-Control": CHART_CACHE_CONTROL,
+            "ETag": f'"{chart_id}"',
+            "Content-Location": _chart_url(chart_id, image_format),
+        },
+    )
+
 @app.post("/analyze", 
-            response_model=AnalysisResponse, 
+            response_model=AnalysisWithChartsResponse, 
             summary="Analyze Financial CSV",
             description="Upload a CSV or PDF file containing municipal financial data. The service will process it using an OpenAI Assistant and return a structured JSON analysis including text and chart data.",
             tags=["Analysis"])
-async def analyze_financial_data(file: UploadFile = File(..., description="The municipal budget CSV or PDF file to analyze.")):
+async def analyze_financial_data(response: Response,
+                                 file: UploadFile = File(..., description="The municipal budget CSV or PDF file to analyze."),
+                                 render_charts: Optional[str] = Query(None, pattern="^(svg|png)$", description="Also render each section's chart on the server in this format (svg or png).")):
     """
     Endpoint to receive a CSV or PDF file and return a structured financial analysis.
+    Optionally renders the section charts and returns their URLs in `chart_images`.
+    The stored result's URL is returned in the `Location` header.
     """
     # Allow both CSV and PDF
     filename_lower = file.filename.lower()
@@ -56,6 +247,22 @@ async def analyze_financial_data(file: UploadFile = File(..., description="The m
     
     print(f"Received file: {file.filename}, content type: {file.content_type}")
     
+    # Admission (upload bytes + run slot) was already granted by the admission_control middleware
+    analysis_result = await _run_analysis(file)
+
+    result_id = result_store.put(analysis_result)
+    response.headers["Location"] = f"/results/{result_id}"
+    response.headers["X-Result-Id"] = result_id
+
+    analysis_with_charts = AnalysisWithChartsResponse.model_validate(analysis_result.model_dump(by_alias=True))
+    if render_charts:
+        # Sections whose chart fails to render are left out instead of failing the analysis
+        chart_ids = await chart_service.render_analysis(analysis_result, render_charts)
+        analysis_with_charts.chart_images = {path: _chart_url(chart_id, render_charts) for path, chart_id in chart_ids.items()}
+    return analysis_with_charts
+
+async def _run_analysis(file: UploadFile) -> AnalysisResponse:
+    """Runs the assistant analysis and maps service errors to HTTP errors."""
     try:
         # Call the assistant service to perform the analysis
         analysis_result = await assistant_service.analyze_csv(file)
@@ -75,6 +282,72 @@ async def analyze_financial_data(file: UploadFile = File(..., description="The m
         # Log the full traceback here in a real application
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
 
+@app.get("/results/{result_id}",
+         summary="Get Stored Analysis",
+         description="Fetch a finished analysis by its content-hash id, optionally only one section (e.g. `section=analise_financeira.1.2`). Supports ETag/If-None-Match and gzip/brotli compression. Results are kept in RESULT_STORE_DIR, shared by all workers using that directory, and survive restarts until the assistant config changes.",
+         response_class=Response,
+         responses={200: {"content": {"application/json": {}}}, 304: {"description": "Not modified."}, 404: {"description": "Unknown result or section."}},
+         tags=["Analysis"])
+async def get_result(result_id: str, request: Request,
+                     section: Optional[str] = Query(None, description="Dotted path of a single section, e.g. 'analise_financeira.1.2' or 'conclusao'.")):
+    """
+    Returns a stored analysis (or one section of it) with conditional GET and compression support.
+    """
+    stored = result_store.get(result_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Result not found.")
+    section_path = section or ""
+    try:
+        etag_hash, body = stored.representation(section_path)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Section not found: {section}")
+
+    etag = f'W/"{etag_hash}"'
+    headers = {"ETag": etag, "Cache-Control": RESULT_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    encoding = negotiate_encoding(request.headers.get("accept-encoding")) if len(body) >= MIN_COMPRESS_BYTES else None
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=stored.encoded(section_path, encoding), media_type="application/json", headers=headers)
+
+@app.post("/charts/render",
+          summary="Render Chart",
+          description="Render a single chart payload (any `chart_data` from an analysis) to SVG or PNG. Images are cached by a hash of the payload.",
+          response_class=Response,
+          responses={200: {"content": {media_type: {} for media_type in CHART_MEDIA_TYPES.values()}}},
+          tags=["Charts"])
+async def render_chart(chart: AnyChart = Body(..., description="The chart payload to render."),
+                       format: str = Query("svg", pattern="^(svg|png)$", description="Output image format.")):
+    """
+    Renders a chart payload and returns the image. The `Content-Location` header holds its cacheable URL.
+    """
+    try:
+        chart_id, image = await chart_service.render(chart, format)
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    return _chart_response(chart_id, image, format)
+
+@app.get("/charts/{chart_id}.{image_format}",
+         summary="Get Rendered Chart",
+         description="Fetch a previously rendered chart image by its content hash.",
+         response_class=Response,
+         responses={200: {"content": {media_type: {} for media_type in CHART_MEDIA_TYPES.values()}}},
+         tags=["Charts"])
+async def get_chart(chart_id: str, image_format: str, request: Request):
+    """
+    Serves a rendered chart with long-lived cache headers, or 304 if the client already has it.
+    """
+    if image_format not in CHART_MEDIA_TYPES:
+        raise HTTPException(status_code=404, detail="Unsupported image format.")
+    if etag_matches(request.headers.get("if-none-match"), f'"{chart_id}"'):
+        return Response(status_code=304, headers={"Cache-Control": CHART_CACHE_CONTROL, "ETag": f'"{chart_id}"'})
+    image = await chart_service.get(chart_id, image_format)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Chart not found. Render it again via /charts/render.")
+    return _chart_response(chart_id, image, image_format)
+
 @app.get("/health", 
          summary="Health Check", 
          description="Simple health check endpoint.",
@@ -85,6 +358,36 @@ async def health_check():
     """
     return {"status": "ok"}
 
+@app.get("/warmup",
+         summary="Warmup Status",
+         description="Whether startup warmup finished, the verified assistant and the pre-created thread pool state.",
+         tags=["Monitoring"])
+async def warmup_state():
+    """
+    Returns the warmup status and thread pool statistics.
+    """
+    return {**warmup_status, "thread_pool": thread_pool.stats()}
+
+@app.get("/config",
+         summary="Assistant Config",
+         description="Fingerprint computed from the running assistant's instructions, function schema and model, cross-checked against the fingerprint stamped at creation and the local assistant_config/.",
+         tags=["Monitoring"])
+async def assistant_config():
+    """
+    Returns the active assistant config fingerprint.
+    """
+    return config_status
+
+@app.get("/admission",
+         summary="Admission Control Utilization",
+         description="Current in-flight upload bytes, active Assistant runs and queue depth against the configured budgets.",
+         tags=["Monitoring"])
+async def admission_utilization():
+    """
+    Returns the admission controller's current utilization snapshot.
+    """
+    return admission_controller.utilization()
+
 # --- Running the App (for local development) ---
 # Use Uvicorn to run the app: uvicorn app.main:app --reload
 if __name__ == "__main__":
@@ -0,0 +1,127 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted within the configured budgets."""
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Limits in-flight upload bytes and active Assistant runs.
+
+    Requests that do not fit in the current budgets wait in a short, bounded
+    queue. If the queue is already full they are rejected immediately (429);
+    if capacity does not free up within `max_queue_wait` seconds they are
+    rejected with 503. Both carry a Retry-After hint.
+
+    Request bytes are accounted by the declared Content-Length, so the check
+    happens before the upload body is received (see the admission_control
+    middleware in app/main.py).
+    """
+
+    def __init__(self, max_inflight_bytes: int, max_active_runs: int,
+                 max_queue_size: int = 8, max_queue_wait: float = 5.0,
+                 retry_after: int = 5):
+        if max_inflight_bytes <= 0:
+            raise ValueError("max_inflight_bytes must be positive.")
+        if max_active_runs <= 0:
+            raise ValueError("max_active_runs must be positive.")
+        self.max_inflight_bytes = max_inflight_bytes
+        self.max_active_runs = max_active_runs
+        self.max_queue_size = max_queue_size
+        self.max_queue_wait = max_queue_wait
+        self.retry_after = retry_after
+
+        self.inflight_bytes = 0
+        self.active_runs = 0
+        self.queued = 0
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self._condition = asyncio.Condition()
+        # Rolling average of how long a run holds its slot, used for Retry-After hints
+        self._avg_run_seconds = None
+
+    def _fits(self, nbytes: int) -> bool:
+        if self.active_runs >= self.max_active_runs:
+            return False
+        # An idle service always admits one request, even one larger than the budget,
+        # so oversized-but-valid uploads are serialized instead of rejected forever.
+        if self.inflight_bytes and self.inflight_bytes + nbytes > self.max_inflight_bytes:
+            return False
+        return True
+
+    def _retry_after_hint(self) -> int:
+        if self._avg_run_seconds is None:
+            return self.retry_after
+        return max(1, math.ceil(self._avg_run_seconds))
+
+    def _reject(self, message: str, status_code: int) -> AdmissionRejected:
+        self.rejected_total += 1
+        print(f"Admission rejected ({status_code}): {message}")
+        return AdmissionRejected(message, status_code, self._retry_after_hint())
+
+    async def acquire(self, nbytes: int) -> None:
+        """Reserves `nbytes` of upload budget and one run slot, waiting briefly if needed."""
+        async with self._condition:
+            if not self._fits(nbytes):
+                if self.queued >= self.max_queue_size:
+                    raise self._reject("Server is at capacity and the admission queue is full.", 429)
+                self.queued += 1
+                try:
+                    await asyncio.wait_for(
+                        self._condition.wait_for(lambda: self._fits(nbytes)),
+                        timeout=self.max_queue_wait,
+                    )
+                except asyncio.TimeoutError:
+                    raise self._reject("Timed out waiting for capacity.", 503)
+                finally:
+                    self.queued -= 1
+            self.inflight_bytes += nbytes
+            self.active_runs += 1
+            self.admitted_total += 1
+
+    async def release(self, nbytes: int, held_seconds: float = None) -> None:
+        """Returns the reserved budget and wakes up queued requests."""
+        async with self._condition:
+            self.inflight_bytes -= nbytes
+            self.active_runs -= 1
+            if held_seconds is not None:
+                if self._avg_run_seconds is None:
+                    self._avg_run_seconds = held_seconds
+                else:
+                    self._avg_run_seconds = 0.8 * self._avg_run_seconds + 0.2 * held_seconds
+            self._condition.notify_all()
+
+    @asynccontextmanager
+    async def admit(self, nbytes: int) -> AsyncIterator[None]:
+        """Context manager wrapping acquire/release around one analysis."""
+        await self.acquire(nbytes)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            await self.release(nbytes, time.monotonic() - started)
+
+    def utilization(self) -> dict:
+        """Returns a snapshot of current usage against the configured budgets."""
+        return {
+            "inflight_bytes": self.inflight_bytes,
+            "max_inflight_bytes": self.max_inflight_bytes,
+            "bytes_utilization": round(self.inflight_bytes / self.max_inflight_bytes, 3),
+            "active_runs": self.active_runs,
+            "max_active_runs": self.max_active_runs,
+            "runs_utilization": round(self.active_runs / self.max_active_runs, 3),
+            "queued": self.queued,
+            "max_queue_size": self.max_queue_size,
+            "admitted_total": self.admitted_total,
+            "rejected_total": self.rejected_total,
+            "avg_run_seconds": round(self._avg_run_seconds, 2) if self._avg_run_seconds is not None else None,
+        }
@@ -1,24 +1,67 @@
 import asyncio
 import json
 import time
+from typing import Optional
 from openai import AsyncOpenAI
 from fastapi import UploadFile # Use FastAPI's UploadFile
 
 # Assuming schemas.analysis is in the python path or same directory level
 from schemas.analysis import AnalysisResponse
+from app.services.thread_pool import ThreadPool
 
 class FinancialAssistantService:
     """Handles interactions with the OpenAI Assistant for financial analysis."""
     
-    def __init__(self, client: AsyncOpenAI, assistant_id: str):
+    def __init__(self, client: AsyncOpenAI, assistant_id: str, thread_pool: Optional[ThreadPool] = None):
         if not client:
             raise ValueError("OpenAI client must be provided.")
         if not assistant_id:
             raise ValueError("Assistant ID must be provided.")
         self.client = client
         self.assistant_id = assistant_id
+        self.thread_pool = thread_pool
         print(f"FinancialAssistantService initialized with Assistant ID: {self.assistant_id}")
 
+    async def warmup(self, connections: int = 1):
+        """Verifies the assistant exists and opens `connections` pooled HTTP connections to the API.
+
+        Returns the retrieved assistant. Raises RuntimeError if it cannot be retrieved.
+        """
+        print(f"Warming up: verifying Assistant {self.assistant_id} over {connections} connection(s)...")
+        # Concurrent requests force the HTTP client to open (and keep alive) one connection each
+        results = await asyncio.gather(
+            *(self.client.beta.assistants.retrieve(self.assistant_id) for _ in range(max(1, connections))),
+            return_exceptions=True,
+        )
+        assistant = next((r for r in results if not isinstance(r, Exception)), None)
+        if assistant is None:
+            raise RuntimeError(f"Could not retrieve Assistant {self.assistant_id}: {results[0]}")
+        print(f"Assistant verified: {assistant.name} (model {assistant.model})")
+        return assistant
+
+    async def keep_warm(self, interval: float, connections: int = 1, on_assistant=None):
+        """Periodically pings the API over `connections` concurrent requests, so every warmed
+        keep-alive connection is reused before it expires.
+
+        The retrieved assistant is passed to `on_assistant`, if given, so config changes are noticed.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            results = await asyncio.gather(
+                *(self.client.beta.assistants.retrieve(self.assistant_id) for _ in range(max(1, connections))),
+                return_exceptions=True,
+            )
+            assistant = next((r for r in results if not isinstance(r, Exception)), None)
+            if assistant is None:
+                print(f"Warning: Keep-warm requests failed: {results[0]}")
+                continue
+            if on_assistant:
+                # A failing callback must not end the loop, or keep-alive and config checks stop with it
+                try:
+                    on_assistant(assistant)
+                except Exception as e:
+                    print(f"Warning: Keep-warm callback failed: {e}")
+
     async def _poll_run_and_extract_response(self, thread_id: str, run_id: str) -> AnalysisResponse:
         """Polls the run status and extracts the function call arguments when ready."""
         print("Polling for run completion...")
@@ -96,11 +139,15 @@ class FinancialAssistantService:
             uploaded_file_id = api_file.id
             print(f"File uploaded successfully. File ID: {uploaded_file_id}")
 
-            # 2. Create a new thread for this analysis
-            print("Creating new thread...")
-            thread = await self.client.beta.threads.create()
-            thread_id = thread.id
-            print(f"Thread created successfully. Thread ID: {thread_id}")
+            # 2. Check out a pre-created thread (or create a new one) for this analysis
+            if self.thread_pool:
+                thread_id = await self.thread_pool.checkout()
+                print(f"Thread checked out from pool. Thread ID: {thread_id}")
+            else:
+                print("Creating new thread...")
+                thread = await self.client.beta.threads.create()
+                thread_id = thread.id
+                print(f"Thread created successfully. Thread ID: {thread_id}")
 
             # 3. Create the message with the file attachment
             print(f"Creating message in thread {thread_id} with attachment {uploaded_file_id}...")
@@ -0,0 +1,250 @@
+import asyncio
+import hashlib
+import io
+import json
+import multiprocessing
+import pathlib
+import re
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+from schemas.analysis import AnalysisResponse, AnyChart, iter_report_sections
+from app.services.file_store import PRUNE_EVERY_WRITES, prune_files, write_atomic
+
+# Supported output formats and their media types
+CHART_MEDIA_TYPES = {
+    "svg": "image/svg+xml",
+    "png": "image/png",
+}
+
+# Chart ids are hex SHA-256 digests; anything else is never looked up on disk
+CHART_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+def chart_hash(chart: AnyChart) -> str:
+    """Returns a stable content hash for a chart payload."""
+    payload = json.dumps(chart.model_dump(mode="json"), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _values(values) -> list:
+    """Replaces missing (null) values with 0 so they can be plotted."""
+    return [v if v is not None else 0 for v in values]
+
+def _render_chart(payload: dict, image_format: str) -> bytes:
+    """Renders one chart payload to image bytes. Runs inside a worker process."""
+    # Imported here so the API process does not load matplotlib unless it renders
+    import matplotlib
+    from matplotlib.figure import Figure
+
+    # Fixed salt for SVG element ids, so re-rendering a chart yields identical bytes
+    matplotlib.rcParams["svg.hashsalt"] = "chart"
+
+    fig = Figure(figsize=(8, 4.5), dpi=100)
+    ax = fig.add_subplot()
+    chart_type = payload.get("chart_type")
+
+    if chart_type == "bar_grouped":
+        labels = payload["labels"]
+        positions = range(len(labels))
+        if payload.get("values_2") is not None:
+            width = 0.4
+            legend = payload.get("legend") or [None, None]
+            ax.bar([p - width / 2 for p in positions], _values(payload["values_1"]), width, label=legend[0])
+            ax.bar([p + width / 2 for p in positions], _values(payload["values_2"]), width, label=legend[1] if len(legend) > 1 else None)
+            if payload.get("legend"):
+                ax.legend()
+        else:
+            ax.bar(positions, _values(payload["values_1"]))
+        ax.set_xticks(list(positions), labels, rotation=20, ha="right")
+    elif chart_type == "pie":
+        ax.pie(_values(payload["values"]), labels=payload["labels"], autopct="%1.1f%%")
+        ax.axis("equal")
+    elif chart_type == "bar_stacked":
+        labels = payload["labels"]
+        values_1 = _values(payload["values_1"])
+        legend = payload["legend"]
+        ax.bar(labels, values_1, label=legend[0] if legend else None)
+        ax.bar(labels, _values(payload["values_2"]), bottom=values_1, label=legend[1] if len(legend) > 1 else None)
+        if legend:
+            ax.legend()
+        ax.tick_params(axis="x", labelrotation=20)
+    elif chart_type == "heatmap":
+        matrix = [[v if v is not None else float("nan") for v in row] for row in payload["values"]]
+        image = ax.imshow(matrix, aspect="auto", cmap="viridis")
+        ax.set_xticks(range(len(payload["columns"])), payload["columns"], rotation=20, ha="right")
+        ax.set_yticks(range(len(payload["rows"])), payload["rows"])
+        fig.colorbar(image, ax=ax)
+    elif chart_type == "line":
+        x = [str(v) for v in payload["x"]]
+        y = [v if v is not None else float("nan") for v in payload["y"]]
+        ax.plot(x, y, marker="o", label=payload["label"])
+        ax.legend()
+    else:
+        raise ValueError(f"Unsupported chart type: {chart_type}")
+
+    ax.set_title(f"Seção {payload.get('section', '')}")
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    # Drop the creation date so the output only depends on the payload
+    metadata = {"Date": None} if image_format == "svg" else {}
+    fig.savefig(buffer, format=image_format, metadata=metadata)
+    return buffer.getvalue()
+
+class ChartRenderService:
+    """Renders chart payloads to SVG/PNG in a process pool and caches the images by content hash.
+
+    Payloads are also written to `directory` as `<chart_id>.json`, so any worker
+    sharing that directory (or the same worker after a restart or eviction)
+    can re-render a chart URL it did not render itself. The directory keeps at
+    most `max_files` payloads, none older than `max_age` seconds.
+    """
+
+    def __init__(self, max_workers: int = 2, cache_size: int = 256, directory: Optional[pathlib.Path] = None,
+                 max_files: int = 50000, max_age: float = 30 * 24 * 3600):
+        if cache_size <= 0:
+            raise ValueError("cache_size must be positive.")
+        self.cache_size = cache_size
+        self.max_workers = max_workers
+        self.directory = pathlib.Path(directory) if directory else None
+        self.max_files = max_files
+        self.max_age = max_age
+        # Prune on the first write, then every PRUNE_EVERY_WRITES writes
+        self._writes_since_prune = PRUNE_EVERY_WRITES
+        # Created by start(), not at import, so worker processes are never forked from a running server
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # (chart_id, format) -> image bytes, in LRU order
+        self._images: "OrderedDict[tuple, bytes]" = OrderedDict()
+        # chart_id -> chart payload, so evicted images can be re-rendered on request
+        self._payloads: "OrderedDict[str, dict]" = OrderedDict()
+        # Renders in progress, so concurrent requests for the same chart share one render
+        self._pending: Dict[tuple, asyncio.Future] = {}
+        print(f"ChartRenderService initialized with {max_workers} workers and cache size {cache_size}")
+
+    def start(self) -> None:
+        """Starts the worker pool using the spawn start method.
+
+        Forking a process that already runs the event loop and HTTP client threads is unsafe,
+        so workers are started fresh instead.
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        if self.directory:
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+            except OSError as e:
+                print(f"Warning: Could not create chart store directory {self.directory} ({e}). Keeping payloads in memory only.")
+                self.directory = None
+
+    def _persist_payload(self, chart_id: str, payload: dict) -> None:
+        """Writes a payload to the shared directory (once) and enforces the disk bound."""
+        path = self.directory / f"{chart_id}.json"
+        if path.exists():
+            return
+        write_atomic(path, json.dumps(payload, ensure_ascii=False))
+        self._writes_since_prune += 1
+        if self._writes_since_prune >= PRUNE_EVERY_WRITES:
+            self._writes_since_prune = 0
+            try:
+                removed = prune_files(self.directory, self.max_files, self.max_age)
+            except OSError as e:
+                print(f"Warning: Could not prune chart store {self.directory}: {e}")
+                return
+            if removed:
+                print(f"Pruned {removed} chart payloads from {self.directory}")
+
+    def _load_payload(self, chart_id: str) -> Optional[dict]:
+        if not self.directory or not CHART_ID_PATTERN.match(chart_id):
+            return None
+        try:
+            with open(self.directory / f"{chart_id}.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (IOError, json.JSONDecodeError) as e:
+            print(f"Warning: Could not read chart payload {chart_id}: {e}")
+            return None
+
+    def _remember_payload(self, chart_id: str, payload: dict) -> None:
+        self._payloads[chart_id] = payload
+        self._payloads.move_to_end(chart_id)
+        # Payloads are small, so keep a few times more of them than images
+        while len(self._payloads) > self.cache_size * 4:
+            self._payloads.popitem(last=False)
+
+    def _cache_image(self, key: tuple, image: bytes) -> None:
+        self._images[key] = image
+        self._images.move_to_end(key)
+        while len(self._images) > self.cache_size:
+            self._images.popitem(last=False)
+
+    async def _render_payload(self, chart_id: str, payload: dict, image_format: str) -> bytes:
+        if image_format not in CHART_MEDIA_TYPES:
+            raise ValueError(f"Unsupported image format: {image_format}")
+        key = (chart_id, image_format)
+        image = self._images.get(key)
+        if image is not None:
+            self._images.move_to_end(key)
+            return image
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        if self._executor is None:
+            raise RuntimeError("ChartRenderService has not been started.")
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, _render_chart, payload, image_format)
+        self._pending[key] = future
+        try:
+            image = await asyncio.shield(future)
+        finally:
+            self._pending.pop(key, None)
+        self._cache_image(key, image)
+        print(f"Rendered chart {chart_id[:12]} as {image_format} ({len(image)} bytes)")
+        return image
+
+    async def render(self, chart: AnyChart, image_format: str) -> tuple:
+        """Renders a chart (or returns the cached image). Returns (chart_id, image_bytes)."""
+        chart_id = chart_hash(chart)
+        payload = chart.model_dump(mode="json")
+        if self.directory:
+            try:
+                self._persist_payload(chart_id, payload)
+            except OSError as e:
+                # The chart is still served from memory by this worker
+                print(f"Warning: Could not persist chart payload {chart_id}: {e}")
+        self._remember_payload(chart_id, payload)
+        image = await self._render_payload(chart_id, payload, image_format)
+        return chart_id, image
+
+    async def get(self, chart_id: str, image_format: str) -> Optional[bytes]:
+        """Returns the image for a previously rendered chart, or None if it is unknown."""
+        payload = self._payloads.get(chart_id)
+        if payload is None:
+            payload = self._load_payload(chart_id)
+            if payload is None:
+                return None
+            self._remember_payload(chart_id, payload)
+        else:
+            self._payloads.move_to_end(chart_id)
+        return await self._render_payload(chart_id, payload, image_format)
+
+    async def render_analysis(self, analysis: AnalysisResponse, image_format: str) -> Dict[str, str]:
+        """Renders every section chart of an analysis concurrently. Returns {section_path: chart_id}.
+
+        Charts that fail to render (e.g. mismatched labels/values from the model) are logged and left out.
+        """
+        sections = [(path, section.chart_data) for path, section in iter_report_sections(analysis) if section.chart_data is not None]
+        results = await asyncio.gather(*(self.render(chart, image_format) for _, chart in sections), return_exceptions=True)
+        chart_ids = {}
+        for (path, _), result in zip(sections, results):
+            if isinstance(result, Exception):
+                print(f"Warning: Failed to render chart for section {path}: {result}")
+                continue
+            chart_ids[path] = result[0]
+        return chart_ids
+
+    def shutdown(self) -> None:
+        """Stops the worker pool."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import pathlib
+import time
+from typing import Any, Dict, List, Optional
+
+# Define paths relative to the project root
+ROOT_DIR = pathlib.Path(__file__).parent.parent.parent
+ASSISTANT_CONFIG_DIR = ROOT_DIR / "assistant_config"
+INSTRUCTIONS_PATH = ASSISTANT_CONFIG_DIR / "instructions.md"
+FUNCTION_SCHEMA_PATH = ASSISTANT_CONFIG_DIR / "analysis_function.json"
+# Local cache of fingerprint -> assistant written by scripts/create_assistant.py (git-ignored).
+# Only speeds up the script's lookup; the fingerprint stamped in assistant metadata is the source of truth.
+REGISTRY_PATH = ASSISTANT_CONFIG_DIR / "registry.json"
+
+# --- Tool Configuration ---
+FUNCTION_NAME = "submit_financial_analysis"
+FUNCTION_DESCRIPTION = "Submits the structured financial analysis based on the provided CSV."
+# Assistant metadata key holding the fingerprint of the config it was created from
+FINGERPRINT_METADATA_KEY = "config_fingerprint"
+# --------------------------
+
+def build_tools(function_schema: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Returns the assistant tool definitions for the given function schema."""
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": FUNCTION_NAME,
+                "description": FUNCTION_DESCRIPTION,
+                "parameters": function_schema,
+            }
+        },
+        {"type": "file_search"} # Tool needed to access files attached to messages
+    ]
+
+def compute_fingerprint(instructions: str, function_schema: Dict[str, Any], model: str) -> str:
+    """Fingerprints everything an assistant is built from: instructions, tools (incl. schema) and model."""
+    config = {
+        "instructions": instructions,
+        "tools": build_tools(function_schema),
+        "model": model,
+    }
+    payload = json.dumps(config, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def load_local_config() -> tuple:
+    """Reads (instructions, function_schema) from assistant_config/. Raises OSError/ValueError on failure."""
+    with open(INSTRUCTIONS_PATH, "r", encoding="utf-8") as f:
+        instructions = f.read()
+    with open(FUNCTION_SCHEMA_PATH, "r", encoding="utf-8") as f:
+        function_schema = json.load(f)
+    return instructions, function_schema
+
+def local_fingerprint(model: str) -> Optional[str]:
+    """Fingerprint of the on-disk config for `model`, or None if the config files cannot be read."""
+    try:
+        instructions, function_schema = load_local_config()
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read local assistant config: {e}")
+        return None
+    return compute_fingerprint(instructions, function_schema, model)
+
+class AssistantRegistry:
+    """Maps config fingerprints to the assistants created from them, stored as JSON on disk."""
+
+    def __init__(self, path: pathlib.Path = REGISTRY_PATH):
+        self.path = pathlib.Path(path)
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f).get("assistants", {})
+        except FileNotFoundError:
+            self._entries = {}
+        except (IOError, json.JSONDecodeError) as e:
+            print(f"Warning: Could not read assistant registry {self.path}: {e}")
+            self._entries = {}
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"assistants": self._entries}, f, indent=2, sort_keys=True, ensure_ascii=False)
+
+    def lookup(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Returns the registry entry for a fingerprint, if any."""
+        return self._entries.get(fingerprint)
+
+    def record(self, fingerprint: str, assistant_id: str, name: str, model: str) -> None:
+        """Registers an assistant under a fingerprint and saves the registry."""
+        self._entries[fingerprint] = {
+            "assistant_id": assistant_id,
+            "name": name,
+            "model": model,
+            "registered_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        self.save()
+
+    def forget(self, fingerprint: str) -> None:
+        if self._entries.pop(fingerprint, None) is not None:
+            self.save()
+
+def fingerprint_from_assistant(assistant) -> Optional[str]:
+    """Computes the fingerprint of a retrieved assistant from its actual instructions, function schema and model.
+
+    Returns None if the assistant has no `submit_financial_analysis` function tool.
+    """
+    for tool in assistant.tools or []:
+        function = getattr(tool, "function", None)
+        if tool.type == "function" and function is not None and function.name == FUNCTION_NAME:
+            return compute_fingerprint(assistant.instructions or "", function.parameters or {}, assistant.model)
+    return None
+
+def stamped_fingerprint(assistant) -> Optional[str]:
+    """Returns the fingerprint create_assistant.py stamped in the assistant's metadata at creation, if any."""
+    metadata = getattr(assistant, "metadata", None) or {}
+    return metadata.get(FINGERPRINT_METADATA_KEY)
@@ -0,0 +1,43 @@
+import os
+import pathlib
+import tempfile
+import time
+
+# Disk bounds are enforced on every Nth write, so writes don't each list the directory
+PRUNE_EVERY_WRITES = 32
+
+def write_atomic(path: pathlib.Path, content: str) -> None:
+    """Writes a text file via a temp file + rename, so concurrent readers never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def prune_files(directory: pathlib.Path, max_files: int, max_age: float, suffix: str = ".json") -> int:
+    """Deletes files older than `max_age` seconds, then the oldest ones beyond `max_files`.
+
+    Returns the number of deleted files.
+    """
+    cutoff = time.time() - max_age
+    files = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(suffix):
+                try:
+                    files.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    continue
+    files.sort()
+    expired = [path for mtime, path in files if mtime < cutoff]
+    overflow = len(files) - len(expired) - max_files
+    removed = expired + [path for _, path in files[len(expired):len(expired) + max(0, overflow)]]
+    for path in removed:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+    return len(removed)
@@ -0,0 +1,281 @@
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+import re
+import shutil
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from schemas.analysis import AnalysisResponse
+from app.services.file_store import PRUNE_EVERY_WRITES, prune_files, write_atomic
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 512
+
+# Result ids are hex SHA-256 digests; anything else is never looked up on disk
+RESULT_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+def canonical_json(data: Any) -> bytes:
+    """Serializes data deterministically so equal content always hashes the same."""
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def content_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+def supported_encodings() -> List[str]:
+    """Content codings the store can produce, in order of preference."""
+    return (["br"] if brotli is not None else []) + ["gzip"]
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=11)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=9)
+    return body
+
+def resolve_section(data: Any, path: str) -> Any:
+    """Resolves a dotted section path such as 'analise_financeira.1.2' inside a result.
+
+    Keys may contain dots themselves ("1.2"), so at each level the longest
+    matching key is used. Raises KeyError if the path does not exist.
+    """
+    parts = path.split(".")
+    node = data
+    i = 0
+    while i < len(parts):
+        if not isinstance(node, dict):
+            raise KeyError(path)
+        for j in range(len(parts), i, -1):
+            key = ".".join(parts[i:j])
+            if key in node:
+                node = node[key]
+                i = j
+                break
+        else:
+            raise KeyError(path)
+    return node
+
+class StoredResult:
+    """One stored analysis plus its lazily built, cached representations."""
+
+    def __init__(self, result_id: str, data: Dict[str, Any], body: bytes, fingerprint: Optional[str] = None):
+        self.result_id = result_id
+        self.data = data
+        # Fingerprint of the assistant config that produced this result
+        self.fingerprint = fingerprint
+        # section path ("" for the whole result) -> (etag hash, identity body)
+        self._bodies: Dict[str, Tuple[str, bytes]] = {"": (result_id, body)}
+        # (section path, encoding) -> compressed body
+        self._encoded: Dict[Tuple[str, str], bytes] = {}
+
+    def representation(self, section: str = "") -> Tuple[str, bytes]:
+        """Returns (etag hash, JSON body) for the whole result or one section."""
+        cached = self._bodies.get(section)
+        if cached is None:
+            body = canonical_json(resolve_section(self.data, section))
+            cached = (content_hash(body), body)
+            self._bodies[section] = cached
+        return cached
+
+    def encoded(self, section: str, encoding: Optional[str]) -> bytes:
+        """Returns the body for a section in the given content coding, compressing it once."""
+        _, body = self.representation(section)
+        if encoding is None:
+            return body
+        key = (section, encoding)
+        compressed = self._encoded.get(key)
+        if compressed is None:
+            compressed = _compress(body, encoding)
+            self._encoded[key] = compressed
+        return compressed
+
+class ResultStore:
+    """Store of finished analyses, addressed by the hash of their content.
+
+    Results are written as `<fingerprint>/<result_id>.json` files under
+    `directory`, so they survive restarts and are shared by every worker
+    pointing at the same directory. An in-memory LRU of `max_entries` results
+    sits in front of the files and also caches their compressed
+    representations. Without a directory the store is in-memory only (single
+    worker, lost on restart).
+
+    Results are keyed by the active assistant config fingerprint: after it
+    changes, results from the previous config are misses. Their files are left
+    in place, since replicas still running the old config (e.g. mid rolling
+    deploy) keep serving them from the same directory.
+
+    Disk usage is bounded on write: each fingerprint directory keeps at most
+    `max_files` results, results older than `max_age` seconds are deleted, and
+    so are whole fingerprint directories that received no write for `max_age`.
+    """
+
+    def __init__(self, max_entries: int = 512, directory: Optional[pathlib.Path] = None,
+                 max_files: int = 10000, max_age: float = 30 * 24 * 3600):
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive.")
+        if max_files <= 0:
+            raise ValueError("max_files must be positive.")
+        self.max_entries = max_entries
+        self.max_files = max_files
+        self.max_age = max_age
+        # Prune on the first write, then every PRUNE_EVERY_WRITES writes
+        self._writes_since_prune = PRUNE_EVERY_WRITES
+        self.directory = pathlib.Path(directory) if directory else None
+        self.fingerprint: Optional[str] = None
+        self._results: "OrderedDict[str, StoredResult]" = OrderedDict()
+        print(f"ResultStore initialized with capacity {max_entries} ({self.directory or 'memory only'})")
+
+    def open(self) -> None:
+        """Creates the store directory. Falls back to memory only if it cannot be created (e.g. read-only filesystem)."""
+        if not self.directory:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            print(f"Warning: Could not create result store directory {self.directory} ({e}). Keeping results in memory only.")
+            self.directory = None
+
+    def _fingerprint_dir(self, fingerprint: Optional[str]) -> pathlib.Path:
+        return self.directory / (fingerprint or "unversioned")
+
+    def _path(self, result_id: str, fingerprint: Optional[str]) -> pathlib.Path:
+        return self._fingerprint_dir(fingerprint) / f"{result_id}.json"
+
+    def _remember(self, stored: StoredResult) -> None:
+        self._results[stored.result_id] = stored
+        self._results.move_to_end(stored.result_id)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    def _write(self, stored: StoredResult) -> None:
+        """Atomically writes a result file, so concurrent readers never see a partial file."""
+        path = self._path(stored.result_id, stored.fingerprint)
+        if path.exists():
+            return
+        path.parent.mkdir(exist_ok=True)
+        write_atomic(path, json.dumps({"fingerprint": stored.fingerprint, "result": stored.data}, ensure_ascii=False))
+        self._writes_since_prune += 1
+        if self._writes_since_prune >= PRUNE_EVERY_WRITES:
+            self._writes_since_prune = 0
+            try:
+                self._prune()
+            except OSError as e:
+                print(f"Warning: Could not prune result store {self.directory}: {e}")
+
+    def _prune(self) -> None:
+        """Enforces the disk bound: file count and age in the active directory, age for stale directories."""
+        cutoff = time.time() - self.max_age
+        active_dir = self._fingerprint_dir(self.fingerprint)
+        with os.scandir(self.directory) as entries:
+            stale_dirs = [
+                entry.path for entry in entries
+                if entry.is_dir() and entry.path != str(active_dir) and entry.stat().st_mtime < cutoff
+            ]
+        for path in stale_dirs:
+            print(f"Removing stale result directory: {path}")
+            shutil.rmtree(path, ignore_errors=True)
+
+        removed = prune_files(active_dir, self.max_files, self.max_age)
+        if removed:
+            print(f"Pruned {removed} stored results from {active_dir}")
+
+    def _read(self, result_id: str) -> Optional[StoredResult]:
+        try:
+            with open(self._path(result_id, self.fingerprint), "r", encoding="utf-8") as f:
+                content = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (IOError, json.JSONDecodeError) as e:
+            print(f"Warning: Could not read stored result {result_id}: {e}")
+            return None
+        data = content["result"]
+        return StoredResult(result_id, data, canonical_json(data), self.fingerprint)
+
+    def put(self, analysis: AnalysisResponse) -> str:
+        """Stores an analysis and returns its stable id (SHA-256 of its canonical JSON)."""
+        data = analysis.model_dump(mode="json", by_alias=True)
+        body = canonical_json(data)
+        result_id = content_hash(body)
+        stored = self._results.get(result_id) or StoredResult(result_id, data, body, self.fingerprint)
+        if self.directory:
+            try:
+                self._write(stored)
+            except OSError as e:
+                # The result is still served from memory by this worker
+                print(f"Warning: Could not persist result {result_id}: {e}")
+        self._remember(stored)
+        return result_id
+
+    def get(self, result_id: str) -> Optional[StoredResult]:
+        stored = self._results.get(result_id)
+        if stored is not None:
+            self._results.move_to_end(result_id)
+            return stored
+        if not self.directory or not RESULT_ID_PATTERN.match(result_id):
+            return None
+        stored = self._read(result_id)
+        if stored is not None:
+            self._remember(stored)
+        return stored
+
+    def set_fingerprint(self, fingerprint: Optional[str]) -> int:
+        """Sets the active config fingerprint and drops cached results produced under any other one.
+
+        Results on disk are not touched: lookups simply move to the new
+        fingerprint's directory. Returns the number of invalidated in-memory results.
+        """
+        if fingerprint == self.fingerprint:
+            return 0
+        self.fingerprint = fingerprint
+        stale = [result_id for result_id, stored in self._results.items() if stored.fingerprint != fingerprint]
+        for result_id in stale:
+            del self._results[result_id]
+        return len(stale)
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Picks the preferred supported content coding from an Accept-Encoding header, or None for identity."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding.strip().lower()] = q
+    best, best_q = None, 0.0
+    for coding in supported_encodings():
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag value."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    wanted = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == wanted:
+            return True
+    return False
@@ -0,0 +1,105 @@
+import asyncio
+from typing import Optional
+from openai import AsyncOpenAI
+
+class ThreadPool:
+    """Keeps a replenishing pool of pre-created, empty Assistant threads.
+
+    Each analysis checks out one thread (threads are never reused), which takes
+    the thread-creation round trip off the request path. A background task
+    tops the pool back up after every checkout.
+    """
+
+    def __init__(self, client: AsyncOpenAI, size: int, retry_delay: float = 5.0):
+        if not client:
+            raise ValueError("OpenAI client must be provided.")
+        if size <= 0:
+            raise ValueError("size must be positive.")
+        self.client = client
+        self.size = size
+        self.retry_delay = retry_delay
+        self._threads: asyncio.Queue = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.created_total = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def _create_thread(self) -> str:
+        thread = await self.client.beta.threads.create()
+        self.created_total += 1
+        return thread.id
+
+    async def _fill(self) -> None:
+        """Creates the missing threads concurrently."""
+        missing = self.size - self._threads.qsize()
+        if missing <= 0:
+            return
+        results = await asyncio.gather(*(self._create_thread() for _ in range(missing)), return_exceptions=True)
+        errors = [r for r in results if isinstance(r, Exception)]
+        for thread_id in results:
+            if not isinstance(thread_id, Exception):
+                self._threads.put_nowait(thread_id)
+        if errors:
+            raise errors[0]
+
+    async def _replenish_loop(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                await self._fill()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Warning: Failed to replenish thread pool: {e}")
+                await asyncio.sleep(self.retry_delay)
+                self._wakeup.set()
+
+    async def start(self) -> None:
+        """Pre-fills the pool and starts the background replenisher."""
+        print(f"Pre-creating {self.size} threads...")
+        try:
+            await self._fill()
+        except Exception as e:
+            # Requests fall back to creating threads on demand, so this is not fatal
+            print(f"Warning: Thread pool pre-fill incomplete ({self._threads.qsize()}/{self.size}): {e}")
+            self._wakeup.set()
+        self._task = asyncio.create_task(self._replenish_loop())
+        print(f"Thread pool ready with {self._threads.qsize()} threads.")
+
+    async def checkout(self) -> str:
+        """Returns a pre-created thread id, or creates one if the pool is empty."""
+        self._wakeup.set()
+        try:
+            thread_id = self._threads.get_nowait()
+            self.hits += 1
+            return thread_id
+        except asyncio.QueueEmpty:
+            self.misses += 1
+            return await self._create_thread()
+
+    async def close(self) -> None:
+        """Stops replenishing and deletes the threads that were never used."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while not self._threads.empty():
+            thread_id = self._threads.get_nowait()
+            try:
+                await self.client.beta.threads.delete(thread_id)
+            except Exception as delete_err:
+                print(f"Warning: Failed to delete pooled thread {thread_id}: {delete_err}")
+
+    def stats(self) -> dict:
+        return {
+            "available": self._threads.qsize(),
+            "target_size": self.size,
+            "created_total": self.created_total,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
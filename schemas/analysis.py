@@ -1,4 +1,4 @@
-from typing import List, Optional, Union, List, Tuple
+from typing import Dict, Iterator, List, Optional, Union, List, Tuple
 from pydantic import BaseModel, Field
 
 # --- Chart Data Models ---
@@ -122,6 +122,20 @@ class AnalysisResponse(BaseModel):
         }
     }
 
+class AnalysisWithChartsResponse(AnalysisResponse):
+    """Analysis report plus links to the server-rendered chart images."""
+    chart_images: Optional[Dict[str, str]] = Field(None, description="Rendered chart URL per section path (e.g. 'analise_financeira.1.1'), when requested.")
+
+def iter_report_sections(analysis: BaseModel, prefix: str = "") -> Iterator[Tuple[str, ReportSection]]:
+    """Yields (path, section) for every ReportSection, using dotted alias paths like 'analise_financeira.1.2'."""
+    for name, field in type(analysis).model_fields.items():
+        value = getattr(analysis, name)
+        path = f"{prefix}{field.alias or name}"
+        if isinstance(value, ReportSection):
+            yield path, value
+        elif isinstance(value, BaseModel):
+            yield from iter_report_sections(value, prefix=f"{path}.")
+
 # Example of how to generate the JSON schema:
 if __name__ == "__main__":
     import json
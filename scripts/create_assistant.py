@@ -1,27 +1,62 @@
 import json
 import os
 import pathlib
+import sys
 from openai import OpenAI
 from dotenv import load_dotenv
 
+# Ensure the app package is in the Python path
+ROOT_DIR = pathlib.Path(__file__).parent.parent
+sys.path.append(str(ROOT_DIR))
+
+from app.services.config_registry import (
+    FUNCTION_SCHEMA_PATH,
+    FINGERPRINT_METADATA_KEY,
+    AssistantRegistry,
+    build_tools,
+    compute_fingerprint,
+    fingerprint_from_assistant,
+    load_local_config,
+)
+
 # Load environment variables (especially OPENAI_API_KEY)
 load_dotenv()
 
-# Define paths relative to the script location
-ROOT_DIR = pathlib.Path(__file__).parent.parent
-ASSISTANT_CONFIG_DIR = ROOT_DIR / "assistant_config"
-INSTRUCTIONS_PATH = ASSISTANT_CONFIG_DIR / "instructions.md"
-FUNCTION_SCHEMA_PATH = ASSISTANT_CONFIG_DIR / "analysis_function.json"
-
 # --- Configuration ---
 ASSISTANT_NAME = "Analista Financeiro Municipal v1"
 ASSISTANT_MODEL = "gpt-4.1" # Or your preferred model
-FUNCTION_NAME = "submit_financial_analysis"
-FUNCTION_DESCRIPTION = "Submits the structured financial analysis based on the provided CSV."
 # -------------------
 
+def find_existing_assistant(client: OpenAI, registry: AssistantRegistry, fingerprint: str):
+    """Returns an existing assistant whose actual config matches `fingerprint`, or None.
+
+    The registry entry and metadata stamp only nominate candidates: an assistant
+    edited in place keeps its stamp, so each candidate's real config is checked.
+    """
+    entry = registry.lookup(fingerprint)
+    if entry:
+        try:
+            assistant = client.beta.assistants.retrieve(entry["assistant_id"])
+        except Exception as e:
+            print(f"Registered assistant {entry['assistant_id']} is no longer available ({e}). Removing it from the registry.")
+            registry.forget(fingerprint)
+        else:
+            if fingerprint_from_assistant(assistant) == fingerprint:
+                return assistant
+            print(f"Registered assistant {assistant.id} was edited since creation. Removing it from the registry.")
+            registry.forget(fingerprint)
+
+    # Not in the local registry (e.g. created from another checkout): look for the fingerprint remotely
+    for assistant in client.beta.assistants.list(limit=100):
+        if (assistant.metadata or {}).get(FINGERPRINT_METADATA_KEY) != fingerprint:
+            continue
+        if fingerprint_from_assistant(assistant) == fingerprint:
+            return assistant
+        print(f"Skipping assistant {assistant.id}: stamped with this fingerprint but edited since creation.")
+    return None
+
 def create_assistant():
-    """Creates the OpenAI Assistant with instructions and function tool."""
+    """Creates the OpenAI Assistant with instructions and function tool, reusing one built from the same config."""
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         print("Error: OPENAI_API_KEY not found in environment variables.")
@@ -32,27 +67,31 @@ def create_assistant():
 
     # --- Load Configuration Files ---
     try:
-        with open(INSTRUCTIONS_PATH, "r", encoding="utf-8") as f:
-            instructions = f.read()
-    except FileNotFoundError:
-        print(f"Error: Instructions file not found at {INSTRUCTIONS_PATH}")
-        return
-    except IOError as e:
-        print(f"Error reading instructions file: {e}")
-        return
-        
-    try:
-        with open(FUNCTION_SCHEMA_PATH, "r", encoding="utf-8") as f:
-            function_schema = json.load(f)
-    except FileNotFoundError:
-        print(f"Error: Function schema file not found at {FUNCTION_SCHEMA_PATH}")
-        print("Did you run `python scripts/gen_schema.py` first?")
+        instructions, function_schema = load_local_config()
+    except FileNotFoundError as e:
+        print(f"Error: Assistant config file not found: {e.filename}")
+        if str(e.filename) == str(FUNCTION_SCHEMA_PATH):
+            print("Did you run `python scripts/gen_schema.py` first?")
         return
     except (IOError, json.JSONDecodeError) as e:
-        print(f"Error reading or parsing function schema file: {e}")
+        print(f"Error reading or parsing assistant config files: {e}")
         return
     # -----------------------------------
 
+    fingerprint = compute_fingerprint(instructions, function_schema, ASSISTANT_MODEL)
+    print(f"Config fingerprint: {fingerprint}")
+    registry = AssistantRegistry()
+
+    try:
+        existing = find_existing_assistant(client, registry, fingerprint)
+        if existing:
+            registry.record(fingerprint, existing.id, existing.name, existing.model)
+            print(f"An assistant built from this exact config already exists. Reusing it.")
+            print(f"Assistant ID: {existing.id}")
+            return existing
+    except Exception as e:
+        print(f"Warning: Could not look up existing assistants ({e}). Creating a new one.")
+
     print(f"Creating assistant '{ASSISTANT_NAME}' with model '{ASSISTANT_MODEL}'...")
 
     try:
@@ -60,18 +99,10 @@ def create_assistant():
             name=ASSISTANT_NAME,
             instructions=instructions,
             model=ASSISTANT_MODEL,
-            tools=[
-                {
-                    "type": "function",
-                    "function": {
-                        "name": FUNCTION_NAME,
-                        "description": FUNCTION_DESCRIPTION,
-                        "parameters": function_schema,
-                    }
-                },
-                {"type": "file_search"} # Tool needed to access files attached to messages
-            ]
+            tools=build_tools(function_schema),
+            metadata={FINGERPRINT_METADATA_KEY: fingerprint},
         )
+        registry.record(fingerprint, assistant.id, ASSISTANT_NAME, ASSISTANT_MODEL)
         print(f"Assistant created successfully!")
         print(f"Assistant ID: {assistant.id}")
         print("\nPlease store this ID securely, for example, in your .env file as ASSISTANT_ID")
@@ -82,6 +113,7 @@ def create_assistant():
         # with open(ROOT_DIR / ".env", "a") as f:
         #     f.write(f"\nASSISTANT_ID={assistant.id}")
         # print("ASSISTANT_ID appended to .env file.")
+        return assistant
         
     except Exception as e:
         print(f"Error creating assistant: {e}")
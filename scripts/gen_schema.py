@@ -24,11 +24,23 @@ output_dir.mkdir(parents=True, exist_ok=True)
 # Generate the JSON schema from the Pydantic model
 schema = AnalysisResponse.model_json_schema()
 
+# Skip needless rewrites (and mtime/VCS churn) when the schema did not change
+existing_file = output_file.exists()
+try:
+    with open(output_file, "r", encoding="utf-8") as f:
+        if json.load(f) == schema:
+            print(f"JSON schema at {output_file} is already up to date.")
+            sys.exit(0)
+except (IOError, json.JSONDecodeError):
+    pass
+
 # Save the schema to the specified file
 try:
     with open(output_file, "w", encoding="utf-8") as f:
         json.dump(schema, f, indent=2, ensure_ascii=False)
     print(f"Successfully generated JSON schema at: {output_file}")
+    if existing_file:
+        print("The assistant config changed. Run `python scripts/create_assistant.py` to get a matching assistant.")
 except IOError as e:
     print(f"Error writing JSON schema file: {e}")
     sys.exit(1) 
\ No newline at end of file